@@ -2,7 +2,15 @@
 Django AI Lens: Natural language queries for Django models, powered by AI.
 """
 
-from django_ai_lens.ai_query import generate_schema, run_ai_query, shape_chart_data
+from django_ai_lens.ai_query import (
+    arun_ai_queries,
+    arun_ai_query,
+    clear_schema_cache,
+    generate_schema,
+    run_ai_queries,
+    run_ai_query,
+    shape_chart_data,
+)
 from django_ai_lens.schema_extrator import (
     DEFAULT_SCHEMA_FILE,
     extract_and_save,
@@ -12,7 +20,11 @@ from django_ai_lens.schema_extrator import (
 )
 
 __all__ = [
+    "arun_ai_queries",
+    "arun_ai_query",
+    "clear_schema_cache",
     "generate_schema",
+    "run_ai_queries",
     "run_ai_query",
     "shape_chart_data",
     "DEFAULT_SCHEMA_FILE",
@@ -1,43 +1,238 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import time
+from functools import lru_cache
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import QuerySet
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
 from pydantic import ValidationError
 
+try:
+    import orjson
+except ImportError:  # Optional speedup: pip install django-ai-lens[orjson]
+    orjson = None
+
 from django_ai_lens.schema_extrator import (
     _filter_excluded_apps,
     _get_installed_app_labels_from_settings,
     extract_and_save,
     get_models_schema,
 )
-from django_ai_lens.prompt_builder import build_messages, build_human_friendly_result_prompt
+from django_ai_lens.prompt_builder import (
+    _render_system_prompt,
+    build_human_friendly_result_prompt,
+    build_messages,
+)
 from django_ai_lens.query_schema import AIQuerySchema, ChartType
 from django_ai_lens.queryset_builder import (
+    _build_model_index,
+    _compile_builder,
+    aqueryset_to_list,
     build_queryset,
     queryset_to_list,
-    resolve_model,
 )
 
 
-def _get_client():
-    """Lazy-initialize Gemini client from Django settings."""
+# One sync client per API key, so its HTTP connection pool is reused across queries
+_client_cache: dict[str, genai.Client] = {}
+
+
+def _get_api_key() -> str:
+    """Get the Gemini API key from Django settings."""
     api_key = getattr(settings, "GEMINI_API_KEY", None)
     if not api_key:
         raise RuntimeError(
             "GEMINI_API_KEY is not set. Add it to your Django settings.py. "
             "Example: GEMINI_API_KEY = 'your_api_key_here'"
         )
-    return genai.Client(api_key=api_key)
+    return api_key
 
 
+def _get_client():
+    """Lazy-initialize Gemini client from Django settings (cached per API key)."""
+    api_key = _get_api_key()
+    client = _client_cache.get(api_key)
+    if client is None:
+        client = _client_cache[api_key] = genai.Client(api_key=api_key)
+    return client
+
+
+def _new_async_client():
+    """
+    Create an async Gemini client (client.aio) for one async call.
+
+    Not cached like _get_client(): the async HTTP transport is bound to the
+    event loop that first uses it, and async_to_sync / asyncio.run start a new
+    loop per call, so a shared client fails with "Event loop is closed".
+    Use it as "async with _new_async_client() as aio:" so its HTTP session is
+    closed when the call ends.
+    """
+    return genai.Client(api_key=_get_api_key()).aio
+
+
+@lru_cache(maxsize=None)
 def _get_model_name():
     """Get model name from Django settings."""
     return getattr(settings, "GEMINI_MODEL", "gemini-2.5-flash")
 
 
+def _get_max_result_rows():
+    """Get the cap on rows returned per query from Django settings (None = no cap)."""
+    return getattr(settings, "MAX_RESULT_ROWS", 10000)
+
+
+def _reset_cached_settings(*, setting, **kwargs):
+    """Drop cached settings lookups when settings change (override_settings)."""
+    if setting == "GEMINI_MODEL":
+        _get_model_name.cache_clear()
+
+
+setting_changed.connect(_reset_cached_settings)
+
+
+# ── Schema cache ───────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=16)
+def _cached_schema(app_labels: tuple[str, ...], include_help_text: bool) -> str:
+    """Models schema per app label set; models only change on deploy/reload."""
+    return get_models_schema(list(app_labels), include_help_text=include_help_text)
+
+
+def clear_schema_cache() -> None:
+    """
+    Drop cached model schemas, rendered prompts, model lookups and compiled
+    queryset builders so the next query re-introspects the models. Call after
+    models change without a process restart
+    (run_ai_query(force_regenerate_schema=True) also does this).
+    """
+    _cached_schema.cache_clear()
+    _render_system_prompt.cache_clear()
+    _build_model_index.cache_clear()
+    _compile_builder.cache_clear()
+
+
+# ── Gemini context cache ───────────────────────────────────────────────────
+
+# (api_key, model_name, system_instruction) -> (cached content name or None,
+# local expiry). Caches belong to the API key's project, so a key change must
+# not reuse another key's handle. None records that the API refused to cache
+# this prompt (e.g. below the model's minimum cacheable size) so we don't
+# retry on every query.
+_context_cache: dict[tuple[str, str, str], tuple[str | None, float]] = {}
+
+
+def _get_context_cache_ttl() -> int:
+    """Get context cache TTL (seconds) from Django settings. 0 disables caching."""
+    return getattr(settings, "GEMINI_CONTEXT_CACHE_TTL", 600)
+
+
+def _get_cached_content(
+    client: genai.Client,
+    model_name: str,
+    system_instruction: str,
+) -> str | None:
+    """
+    Upload the system instruction (prompt + schema) to Gemini's context cache
+    once and return its handle, so retries and later queries against the same
+    schema reference it instead of resending the full prompt.
+    """
+    ttl = _get_context_cache_ttl()
+    if not ttl:
+        return None
+
+    key = (_get_api_key(), model_name, system_instruction)
+    now = time.monotonic()
+    entry = _context_cache.get(key)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    try:
+        cache = client.caches.create(
+            model=model_name,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                ttl=f"{ttl}s",
+            ),
+        )
+        name = cache.name
+    except Exception as e:
+        print(f"[AI Query] Context cache unavailable, sending prompt inline: {e}")
+        name = None
+
+    # Expire locally a bit before the server does so we never reference a dead cache
+    _context_cache[key] = (name, now + ttl * 0.9)
+    return name
+
+
+def _build_generate_config(
+    client: genai.Client,
+    model_name: str,
+    system_instruction: str,
+    use_cache: bool = True,
+) -> types.GenerateContentConfig:
+    """
+    Generation config for the query call, using the context cache when available
+    (and use_cache is set).
+
+    The response is constrained to JSON matching AIQuerySchema (structured
+    output), so the model can't return prose, code fences or a wrong shape.
+    """
+    structured_output = dict(
+        response_mime_type="application/json",
+        response_schema=AIQuerySchema,
+        max_output_tokens=2048,
+    )
+    cached_content = (
+        _get_cached_content(client, model_name, system_instruction)
+        if use_cache
+        else None
+    )
+    if cached_content:
+        return types.GenerateContentConfig(
+            cached_content=cached_content,
+            **structured_output,
+        )
+    return types.GenerateContentConfig(
+        system_instruction=system_instruction,
+        **structured_output,
+    )
+
+
+def _is_stale_cache_error(
+    config: types.GenerateContentConfig,
+    error: genai_errors.ClientError,
+) -> bool:
+    """
+    Whether a call failed because its context cache is gone (expired or
+    evicted server-side) or not readable with the current API key.
+    """
+    return config.cached_content is not None and error.code in (403, 404)
+
+
+def _uncached_generate_config(
+    client: genai.Client,
+    model_name: str,
+    system_instruction: str,
+    error: genai_errors.ClientError,
+) -> types.GenerateContentConfig:
+    """
+    Forget a context cache the API rejected and return a config that sends the
+    system instruction inline. A later query creates a fresh cache.
+    """
+    print(f"[AI Query] Context cache rejected, sending prompt inline: {error}")
+    _context_cache.pop((_get_api_key(), model_name, system_instruction), None)
+    return _build_generate_config(
+        client, model_name, system_instruction, use_cache=False
+    )
+
+
 # ── Main entry point ───────────────────────────────────────────────────────
 
 def generate_schema(app_labels: list[str] | None = None) -> str:
@@ -106,107 +301,60 @@ def run_ai_query(
             If False (default), schema contains only field types and relations.
 
     Returns:
-        dict with success, question, query_schema, data, row_count, chart_type, chart_data.
+        dict with success, question, query_schema, data, row_count, truncated,
+        chart_type, chart_data. truncated is True when the query had no limit and
+        rows past MAX_RESULT_ROWS were dropped.
         When human_friendly_result=True, also includes human_friendly_result (LLM-rendered summary).
     """
-    if app_labels is None:
-        app_labels = _get_installed_app_labels_from_settings()
-    else:
-        app_labels = _filter_excluded_apps(app_labels)
-    if not app_labels:
-        raise ValueError(
-            "No app labels available. Provide app_labels explicitly, or ensure "
-            "INSTALLED_APPS in settings.py contains your Django apps."
-        )
-
-    if force_regenerate_schema:
-        extract_and_save()
-
-    schema = get_models_schema(app_labels, include_help_text=include_help_text)
-    payload = build_messages(
-        schema,
+    app_labels, payload = _prepare_query(
         question,
+        app_labels,
+        force_regenerate_schema=force_regenerate_schema,
         human_friendly_result=human_friendly_result,
+        include_help_text=include_help_text,
     )
 
     client = _get_client()
     model_name = _get_model_name()
 
+    config = _build_generate_config(client, model_name, payload["system"])
+
     last_error: str = ""
-    messages = payload["messages"]
+    contents = _to_contents(payload["messages"])
 
     for attempt in range(1, max_retries + 2):  # 1 initial + max_retries
-        # ── Convert messages to google.genai Content format ─────────────────
-        contents = []
-        for msg in messages:
-            part = types.Part.from_text(text=msg["content"])
-            if msg["role"] == "user":
-                contents.append(types.UserContent(parts=[part]))
-            else:
-                contents.append(types.ModelContent(parts=[part]))
-
         # ── LLM call ──────────────────────────────────────────────────────
-        response = client.models.generate_content(
-            model=model_name,
-            contents=contents,
-            config=types.GenerateContentConfig(
-                system_instruction=payload["system"],
-                max_output_tokens=2048,
-            ),
-        )
-        raw_text = response.text.strip()
-
-        # Strip accidental markdown fences
-        if raw_text.startswith("```"):
-            raw_text = raw_text.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-
-        # ── Parse JSON ────────────────────────────────────────────────────
-        try:
-            raw_json = json.loads(raw_text)
-        except json.JSONDecodeError as e:
-            last_error = f"Invalid JSON on attempt {attempt}: {e}"
-            print(f"[AI Query attempt {attempt}] Error: {last_error}")
-            messages = _append_retry_message(messages, raw_text, last_error)
-            continue
-
-        # ── Pydantic validation ───────────────────────────────────────────
         try:
-            query_schema = AIQuerySchema(**raw_json)
-        except ValidationError as e:
-            last_error = f"Schema validation failed on attempt {attempt}:\n{e}"
-            print(f"[AI Query attempt {attempt}] Error: {last_error}")
-            messages = _append_retry_message(messages, raw_text, last_error)
-            continue
+            response = client.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config,
+            )
+        except genai_errors.ClientError as e:
+            if not _is_stale_cache_error(config, e):
+                raise
+            config = _uncached_generate_config(client, model_name, payload["system"], e)
+            response = client.models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config,
+            )
+        raw_text = response.text.strip()
 
-        # ── Queryset execution ────────────────────────────────────────────
+        # ── Parse, validate and execute ───────────────────────────────────
         try:
-            qs = build_queryset(query_schema, app_labels)
-            django_query = _build_django_query_string(query_schema, app_labels)
-            # Debug: print Django queryset and SQL
-            print(f"[AI Query attempt {attempt}] Django queryset (debug): {django_query}")
-            print(f"[AI Query attempt {attempt}] SQL (debug): {qs.query}")
-            data = queryset_to_list(qs)
-        except Exception as e:
-            last_error = f"Queryset error on attempt {attempt}: {e}"
+            raw_json, query_schema = _parse_response(raw_text, attempt)
+            django_query, data, truncated = _execute_query(query_schema, app_labels, attempt)
+        except _AttemptError as e:
+            last_error = str(e)
             print(f"[AI Query attempt {attempt}] Error: {last_error}")
-            messages = _append_retry_message(messages, raw_text, last_error)
+            _append_retry_contents(contents, raw_text, last_error)
             continue
 
         # ── Success ───────────────────────────────────────────────────────
-        chart_data = None
-        if query_schema.chart_type != ChartType.NONE and query_schema.aggregations:
-            chart_data = shape_chart_data(data, query_schema)
-
-        result = {
-            "success": True,
-            "question": question,
-            "query_schema": raw_json,       # Transparent — frontend can show this
-            "django_query": django_query,   # Django ORM chain for debugging
-            "data": data,
-            "row_count": len(data),
-            "chart_type": query_schema.chart_type.value,
-            "chart_data": chart_data,
-        }
+        result = _build_result(
+            question, raw_json, query_schema, django_query, data, truncated
+        )
 
         if human_friendly_result:
             result["human_friendly_result"] = _render_human_friendly_result(
@@ -226,39 +374,414 @@ def run_ai_query(
     )
 
 
+async def arun_ai_query(
+    question: str,
+    app_labels: list[str] | None = None,
+    max_retries: int = 2,
+    force_regenerate_schema: bool = False,
+    human_friendly_result: bool = False,
+    include_help_text: bool = False,
+    hedge_after: float | None = None,
+) -> dict:
+    """
+    Async version of run_ai_query for ASGI views and other async callers.
+
+    LLM calls go through the async Gemini client and rows are read with the
+    async ORM (QuerySet.aiterator), so the event loop is free while waiting
+    on the model or the database.
+
+    Optionally, the first LLM call is hedged: if no response arrives within
+    hedge_after seconds, an identical (separately billed) request is sent and
+    whichever answers first is used. Retries after a failed attempt are
+    sequential, since each one carries the previous error back to the model.
+
+    Args:
+        question, app_labels, max_retries, force_regenerate_schema,
+        human_friendly_result, include_help_text: Same as run_ai_query.
+        hedge_after: Seconds to wait before sending a duplicate first request.
+            None (default) disables hedging.
+
+    Returns:
+        Same dict as run_ai_query.
+    """
+    async with _new_async_client() as aio:
+        return await _arun_ai_query(
+            aio,
+            question,
+            app_labels=app_labels,
+            max_retries=max_retries,
+            force_regenerate_schema=force_regenerate_schema,
+            human_friendly_result=human_friendly_result,
+            include_help_text=include_help_text,
+            hedge_after=hedge_after,
+        )
+
+
+async def _arun_ai_query(
+    aio,
+    question: str,
+    app_labels: list[str] | None,
+    max_retries: int,
+    force_regenerate_schema: bool,
+    human_friendly_result: bool,
+    include_help_text: bool,
+    hedge_after: float | None,
+) -> dict:
+    """Body of arun_ai_query, using the given async client for LLM calls."""
+    app_labels, payload = await sync_to_async(_prepare_query)(
+        question,
+        app_labels,
+        force_regenerate_schema=force_regenerate_schema,
+        human_friendly_result=human_friendly_result,
+        include_help_text=include_help_text,
+    )
+
+    client = _get_client()
+    model_name = _get_model_name()
+
+    config = await sync_to_async(_build_generate_config, thread_sensitive=False)(
+        client, model_name, payload["system"]
+    )
+
+    last_error: str = ""
+    contents = _to_contents(payload["messages"])
+
+    for attempt in range(1, max_retries + 2):  # 1 initial + max_retries
+        # ── LLM call ──────────────────────────────────────────────────────
+        request = dict(model=model_name, contents=contents, config=config)
+        try:
+            if attempt == 1 and hedge_after is not None:
+                response = await _hedged_generate_content(aio, request, hedge_after)
+            else:
+                response = await aio.models.generate_content(**request)
+        except genai_errors.ClientError as e:
+            if not _is_stale_cache_error(config, e):
+                raise
+            config = _uncached_generate_config(client, model_name, payload["system"], e)
+            request["config"] = config
+            response = await aio.models.generate_content(**request)
+        raw_text = response.text.strip()
+
+        # ── Parse, validate and execute ───────────────────────────────────
+        try:
+            raw_json, query_schema = _parse_response(raw_text, attempt)
+            django_query, data, truncated = await _aexecute_query(
+                query_schema, app_labels, attempt
+            )
+        except _AttemptError as e:
+            last_error = str(e)
+            print(f"[AI Query attempt {attempt}] Error: {last_error}")
+            _append_retry_contents(contents, raw_text, last_error)
+            continue
+
+        # ── Success ───────────────────────────────────────────────────────
+        result = _build_result(
+            question, raw_json, query_schema, django_query, data, truncated
+        )
+
+        if human_friendly_result:
+            response = await aio.models.generate_content(
+                model=model_name,
+                contents=_human_friendly_contents(question, data, django_query),
+                config=types.GenerateContentConfig(max_output_tokens=2048),
+            )
+            result["human_friendly_result"] = response.text.strip()
+
+        return result
+
+    # All retries exhausted
+    raise RuntimeError(
+        f"AI query failed after {max_retries + 1} attempts. "
+        f"Last error: {last_error}"
+    )
+
+
+async def arun_ai_queries(
+    questions: list[str],
+    app_labels: list[str] | None = None,
+    max_retries: int = 2,
+    force_regenerate_schema: bool = False,
+    human_friendly_result: bool = False,
+    include_help_text: bool = False,
+    hedge_after: float | None = None,
+) -> list[dict]:
+    """
+    Run several questions concurrently, e.g. the panels of a dashboard.
+
+    The schema, system prompt and Gemini context cache are prepared once and
+    shared by every question, then all LLM calls are in flight at the same
+    time instead of one after another.
+
+    Args:
+        questions: Natural language queries.
+        Other arguments: Same as arun_ai_query, applied to every question.
+
+    Returns:
+        One run_ai_query result dict per question, in order. Raises the first
+        error if any question fails after its retries.
+    """
+    if not questions:
+        return []
+
+    app_labels, payload = await sync_to_async(_prepare_query)(
+        questions[0],
+        app_labels,
+        force_regenerate_schema=force_regenerate_schema,
+        human_friendly_result=human_friendly_result,
+        include_help_text=include_help_text,
+    )
+    # Warm the context cache so concurrent queries don't each create one
+    await sync_to_async(_build_generate_config, thread_sensitive=False)(
+        _get_client(), _get_model_name(), payload["system"]
+    )
+
+    # One async client for the whole batch, bound to this event loop
+    async with _new_async_client() as aio:
+        return await asyncio.gather(*(
+            _arun_ai_query(
+                aio,
+                question,
+                app_labels=app_labels,
+                max_retries=max_retries,
+                force_regenerate_schema=False,
+                human_friendly_result=human_friendly_result,
+                include_help_text=include_help_text,
+                hedge_after=hedge_after,
+            )
+            for question in questions
+        ))
+
+
+def run_ai_queries(
+    questions: list[str],
+    app_labels: list[str] | None = None,
+    max_retries: int = 2,
+    force_regenerate_schema: bool = False,
+    human_friendly_result: bool = False,
+    include_help_text: bool = False,
+) -> list[dict]:
+    """
+    Synchronous wrapper around arun_ai_queries for sync views and scripts.
+    Must not be called from a running event loop — await arun_ai_queries there.
+    """
+    return async_to_sync(arun_ai_queries)(
+        questions,
+        app_labels=app_labels,
+        max_retries=max_retries,
+        force_regenerate_schema=force_regenerate_schema,
+        human_friendly_result=human_friendly_result,
+        include_help_text=include_help_text,
+    )
+
+
+# ── Pipeline steps (shared by run_ai_query / arun_ai_query) ─────────────────
+
+class _AttemptError(Exception):
+    """A failed attempt whose message is fed back to the LLM on retry."""
+
+
+def _prepare_query(
+    question: str,
+    app_labels: list[str] | None,
+    force_regenerate_schema: bool,
+    human_friendly_result: bool,
+    include_help_text: bool,
+) -> tuple[list[str], dict]:
+    """Resolve app labels and build the LLM payload for a question."""
+    if app_labels is None:
+        app_labels = _get_installed_app_labels_from_settings()
+    else:
+        app_labels = _filter_excluded_apps(app_labels)
+    if not app_labels:
+        raise ValueError(
+            "No app labels available. Provide app_labels explicitly, or ensure "
+            "INSTALLED_APPS in settings.py contains your Django apps."
+        )
+
+    if force_regenerate_schema:
+        clear_schema_cache()
+        extract_and_save()
+
+    schema = _cached_schema(tuple(app_labels), include_help_text)
+    payload = build_messages(
+        schema,
+        question,
+        human_friendly_result=human_friendly_result,
+    )
+    return app_labels, payload
+
+
+def _to_contents(messages: list[dict]) -> list[types.Content]:
+    """Convert role/content message dicts to google.genai Content objects."""
+    contents = []
+    for msg in messages:
+        part = types.Part.from_text(text=msg["content"])
+        if msg["role"] == "user":
+            contents.append(types.UserContent(parts=[part]))
+        else:
+            contents.append(types.ModelContent(parts=[part]))
+    return contents
+
+
+def _parse_response(raw_text: str, attempt: int) -> tuple[dict, AIQuerySchema]:
+    """Parse and validate the LLM output. Raises _AttemptError on failure."""
+    try:
+        query_schema = AIQuerySchema.model_validate_json(raw_text)
+    except ValidationError as e:
+        if any(err["type"] == "json_invalid" for err in e.errors()):
+            raise _AttemptError(f"Invalid JSON on attempt {attempt}: {e}") from e
+        raise _AttemptError(
+            f"Schema validation failed on attempt {attempt}:\n{e}"
+        ) from e
+
+    raw_json = query_schema.model_dump(mode="json")
+    return raw_json, query_schema
+
+
+def _execute_query(
+    query_schema: AIQuerySchema,
+    app_labels: list[str],
+    attempt: int,
+) -> tuple[str, list[dict], bool]:
+    """
+    Build and run the queryset. Raises _AttemptError on failure.
+    Returns (django_query, data, truncated).
+    """
+    max_rows = _row_cap(query_schema)
+    try:
+        qs, django_query = _build_attempt_queryset(
+            query_schema, app_labels, attempt, max_rows
+        )
+        data = queryset_to_list(qs)
+    except Exception as e:
+        raise _AttemptError(f"Queryset error on attempt {attempt}: {e}") from e
+    return django_query, data, _truncate(data, max_rows)
+
+
+async def _aexecute_query(
+    query_schema: AIQuerySchema,
+    app_labels: list[str],
+    attempt: int,
+) -> tuple[str, list[dict], bool]:
+    """Async version of _execute_query, reading rows with the async ORM."""
+    max_rows = _row_cap(query_schema)
+    try:
+        qs, django_query = _build_attempt_queryset(
+            query_schema, app_labels, attempt, max_rows
+        )
+        data = await aqueryset_to_list(qs)
+    except Exception as e:
+        raise _AttemptError(f"Queryset error on attempt {attempt}: {e}") from e
+    return django_query, data, _truncate(data, max_rows)
+
+
+def _row_cap(query_schema: AIQuerySchema) -> int | None:
+    """
+    Max rows to return for a query. A schema limit already slices the queryset,
+    so MAX_RESULT_ROWS only applies to queries without one (None = no cap).
+    """
+    return None if query_schema.limit else _get_max_result_rows()
+
+
+def _truncate(data: list[dict], max_rows: int | None) -> bool:
+    """Drop rows past the cap in place; return whether any were dropped."""
+    if max_rows is None or len(data) <= max_rows:
+        return False
+    del data[max_rows:]
+    return True
+
+
+def _build_attempt_queryset(
+    query_schema: AIQuerySchema,
+    app_labels: list[str],
+    attempt: int,
+    max_rows: int | None = None,
+) -> tuple[QuerySet, str]:
+    """
+    Build the (lazy) queryset and its debug string for an attempt. A row cap
+    becomes a LIMIT of max_rows + 1, so truncation can still be detected.
+    """
+    qs = build_queryset(query_schema, app_labels)
+    if max_rows is not None:
+        qs = qs[: max_rows + 1]
+    django_query = _build_django_query_string(query_schema, app_labels)
+    # Debug: print Django queryset and SQL
+    print(f"[AI Query attempt {attempt}] Django queryset (debug): {django_query}")
+    print(f"[AI Query attempt {attempt}] SQL (debug): {qs.query}")
+    return qs, django_query
+
+
+def _build_result(
+    question: str,
+    raw_json: dict,
+    query_schema: AIQuerySchema,
+    django_query: str,
+    data: list[dict],
+    truncated: bool,
+) -> dict:
+    """Assemble the success payload returned to the caller."""
+    chart_data = None
+    if query_schema.chart_type != ChartType.NONE and query_schema.aggregations:
+        chart_data = shape_chart_data(data, query_schema)
+
+    return {
+        "success": True,
+        "question": question,
+        "query_schema": raw_json,       # Validated AI query — frontend can show this
+        "django_query": django_query,   # Django ORM chain for debugging
+        "data": data,
+        "row_count": len(data),
+        "truncated": truncated,         # True if rows past MAX_RESULT_ROWS were dropped
+        "chart_type": query_schema.chart_type.value,
+        "chart_data": chart_data,
+    }
+
+
+async def _hedged_generate_content(
+    aio,
+    request: dict,
+    hedge_after: float,
+):
+    """
+    Send a generate_content request; if it hasn't answered within hedge_after
+    seconds, send a duplicate and return whichever succeeds first. Requests
+    still running on return (or if the caller is cancelled) are cancelled.
+    """
+    tasks: list[asyncio.Future] = []
+    try:
+        first = asyncio.ensure_future(aio.models.generate_content(**request))
+        tasks.append(first)
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+
+        tasks.append(asyncio.ensure_future(aio.models.generate_content(**request)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        return first.result()  # Both failed — surface the original error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
 # ── Django query string (debug) ───────────────────────────────────────────
 
 def _build_django_query_string(schema: AIQuerySchema, app_labels: list[str]) -> str:
     """
     Build a Python-style Django ORM chain string for debugging.
-    Example: Author.objects.filter(age__gte=30).select_related('publisher').values('name')[:10]
+    Example: Author.objects.all().filter(age__gte=30).values('name')[:10]
     """
-    from django_ai_lens.queryset_builder import _is_prefetch_relation
-
     model_name = schema.model
     parts = [f"{model_name}.objects.all()"]
 
-    # select_related / prefetch_related (use model metadata for correct detection)
-    if schema.joins:
-        try:
-            model = resolve_model(model_name, app_labels)
-            forward = [j.from_field for j in schema.joins if not _is_prefetch_relation(model, j.from_field)]
-            prefetch = [j.from_field for j in schema.joins if _is_prefetch_relation(model, j.from_field)]
-        except Exception:
-            # Fallback heuristic if model can't be resolved
-            forward = [j.from_field for j in schema.joins if "_set" not in j.from_field]
-            prefetch = [j.from_field for j in schema.joins if "_set" in j.from_field]
-        if forward:
-            args = ", ".join(repr(p) for p in forward)
-            parts.append(f".select_related({args})")
-        if prefetch:
-            args = ", ".join(repr(p) for p in prefetch)
-            parts.append(f".prefetch_related({args})")
-
-    # filter
+    # filter (one call per condition, as in build_queryset)
     for f in schema.filters:
-        lookup = f"{f.field}__{f.operator.value}"
-        parts.append(f".filter({lookup}={f.value!r})")
+        parts.append(f".filter({f.field}__{f.operator.value}={f.value!r})")
 
     # values (group_by or select_fields)
     if schema.group_by:
@@ -277,10 +800,14 @@ def _build_django_query_string(schema: AIQuerySchema, app_labels: list[str]) ->
             ann_args.append(f"{agg.alias}={cls}('{agg.field}')")
         parts.append(f".annotate({', '.join(ann_args)})")
 
+    # full rows as dicts
+    if not (schema.group_by or schema.select_fields):
+        parts.append(".values()")
+
     # order_by
     if schema.order_by:
         fields = [
-            f"-{o.field}" if o.direction == "desc" else o.field
+            "-" + o.field if o.direction == "desc" else o.field
             for o in schema.order_by
         ]
         args = ", ".join(repr(f) for f in fields)
@@ -306,40 +833,48 @@ def _render_human_friendly_result(
     Call the LLM with the question, Django queryset, and result data to produce
     a human-friendly summary/answer.
     """
-    data_str = json.dumps(data, indent=2, default=str)
-    prompt = build_human_friendly_result_prompt(
-        question=question,
-        data=data_str,
-        django_query=django_query,
-    )
     response = client.models.generate_content(
         model=model_name,
-        contents=[types.UserContent(parts=[types.Part.from_text(text=prompt)])],
+        contents=_human_friendly_contents(question, data, django_query),
         config=types.GenerateContentConfig(max_output_tokens=2048),
     )
     return response.text.strip()
 
 
+def _human_friendly_contents(
+    question: str,
+    data: list[dict],
+    django_query: str,
+) -> list[types.Content]:
+    """Build the request contents for the human-friendly summary call."""
+    if orjson is not None:
+        data_str = orjson.dumps(data, default=str, option=orjson.OPT_INDENT_2).decode()
+    else:
+        data_str = json.dumps(data, indent=2, default=str)
+    prompt = build_human_friendly_result_prompt(
+        question=question,
+        data=data_str,
+        django_query=django_query,
+    )
+    return [types.UserContent(parts=[types.Part.from_text(text=prompt)])]
+
+
 # ── Retry helper ───────────────────────────────────────────────────────────
 
-def _append_retry_message(
-    messages: list[dict],
+def _append_retry_contents(
+    contents: list[types.Content],
     bad_output: str,
     error: str,
-) -> list[dict]:
+) -> None:
     """
-    Extend the conversation so the LLM can self-correct on the next attempt.
+    Extend the conversation in place so the LLM can self-correct on the next
+    attempt. Earlier turns are already Content objects and are not rebuilt.
     """
-    return messages + [
-        {"role": "assistant", "content": bad_output},
-        {
-            "role": "user",
-            "content": (
-                f"Your previous response caused this error:\n{error}\n\n"
-                "Please return a corrected JSON object only, with no explanation."
-            ),
-        },
-    ]
+    contents.append(types.ModelContent(parts=[types.Part.from_text(text=bad_output)]))
+    contents.append(types.UserContent(parts=[types.Part.from_text(text=(
+        f"Your previous response caused this error:\n{error}\n\n"
+        "Please return a corrected JSON object only, with no explanation."
+    ))]))
 
 
 # ── Chart data shaper ──────────────────────────────────────────────────────
@@ -357,27 +892,32 @@ def shape_chart_data(data: list[dict], schema: AIQuerySchema) -> dict:
         return {"labels": [], "datasets": []}
 
     # Determine label field (first group_by, or first non-aggregation key)
-    agg_aliases = {agg.alias for agg in schema.aggregations}
     label_field = None
 
     if schema.group_by:
         label_field = schema.group_by[0]
     else:
         # Fallback: first key that isn't an aggregation alias
+        agg_aliases = {agg.alias for agg in schema.aggregations}
         for key in data[0].keys():
             if key not in agg_aliases:
                 label_field = key
                 break
 
-    labels = [str(row.get(label_field, "")) for row in data] if label_field else []
+    # Fill labels and one dataset per aggregation in a single pass over rows
+    aliases = [agg.alias for agg in schema.aggregations]
+    labels: list[str] = []
+    series: list[list] = [[] for _ in aliases]
+    add_label = labels.append
+    for row in data:
+        if label_field:
+            add_label(str(row.get(label_field, "")))
+        for values, alias in zip(series, aliases):
+            values.append(row.get(alias))
 
-    # Build one dataset per aggregation
     datasets = [
-        {
-            "label": agg.alias.replace("_", " ").title(),
-            "data": [row.get(agg.alias) for row in data],
-        }
-        for agg in schema.aggregations
+        {"label": alias.replace("_", " ").title(), "data": values}
+        for alias, values in zip(aliases, series)
     ]
 
     return {
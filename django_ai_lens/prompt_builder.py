@@ -1,4 +1,4 @@
-from langchain_core.prompts import ChatPromptTemplate
+from functools import lru_cache
 
 SYSTEM_TEMPLATE = """
 You are a Django database analyst. Given a schema and a user question, return ONLY
@@ -7,42 +7,42 @@ a single valid JSON object — no explanation, no markdown, no code fences. Raw
 ══════════════════════════════════════════════════════
 JSON STRUCTURE
 ══════════════════════════════════════════════════════
-{{
+{
   "model":         "<RootModelName>",
 
   "joins": [
-    {{
+    {
       "model":      "<RelatedModelName>",
       "from_field": "<ORM double-underscore path from root to this relation>",
       "join_type":  "inner" | "left"
-    }}
+    }
   ],
 
   "filters": [
-    {{
+    {
       "field":    "<field or relation__field>",
       "operator": "<see allowed operators>",
       "value":    <string | number | bool | list | null>
-    }}
+    }
   ],
 
   "aggregations": [
-    {{
+    {
       "field":          "<field or relation__field>",
       "operation":      "<see allowed operations>",
       "alias":          "<snake_case_result_name>",
       "filter_field":   "<optional: field to filter this aggregation only>",
       "filter_operator":"<optional: operator for the filter above>",
       "filter_value":   <optional: value for the filter above>
-    }}
+    }
   ],
 
   "group_by":      ["<field or relation__field>"],
   "select_fields": ["<field or relation__field>"],
-  "order_by":      [{{ "field": "<alias or field>", "direction": "asc" | "desc" }}],
+  "order_by":      [{ "field": "<alias or field>", "direction": "asc" | "desc" }],
   "limit":         <int | null>,
   "chart_type":    "bar" | "line" | "pie" | "doughnut" | "radar" | "scatter" | "none"
-}}
+}
 
 ══════════════════════════════════════════════════════
 ALLOWED FILTER OPERATORS
@@ -83,59 +83,59 @@ GENERAL RULES
 - limit should be null unless the user asks for top-N.
 - If the question implies a chart, set chart_type accordingly.
 - Return ONLY the JSON — no surrounding text.
-{output_mode_section}
+__OUTPUT_MODE_SECTION__
 
 ══════════════════════════════════════════════════════
 SCHEMA
 ══════════════════════════════════════════════════════
-{schema}
+__SCHEMA__
 
 ══════════════════════════════════════════════════════
 EXAMPLES
 ══════════════════════════════════════════════════════
-{examples}
+__EXAMPLES__
 """
 
 # Machine mode: examples for chart/frontend output (grouped lists)
 MACHINE_EXAMPLES = """Q: "Total revenue per customer country in 2024, as a bar chart"
 A:
-{{
+{
   "model": "Order",
   "joins": [
-    {{"model": "Customer", "from_field": "customer", "join_type": "inner"}}
+    {"model": "Customer", "from_field": "customer", "join_type": "inner"}
   ],
   "filters": [
-    {{"field": "created_at", "operator": "year", "value": 2024}}
+    {"field": "created_at", "operator": "year", "value": 2024}
   ],
   "aggregations": [
-    {{"field": "total_amount", "operation": "sum", "alias": "total_revenue"}}
+    {"field": "total_amount", "operation": "sum", "alias": "total_revenue"}
   ],
   "group_by": ["customer__country"],
   "select_fields": [],
-  "order_by": [{{"field": "total_revenue", "direction": "desc"}}],
+  "order_by": [{"field": "total_revenue", "direction": "desc"}],
   "limit": null,
   "chart_type": "bar"
-}}
+}
 
 Q: "Average order value per product category for orders with at least 2 items"
 A:
-{{
+{
   "model": "Order",
   "joins": [
-    {{"model": "OrderItem", "from_field": "orderitem_set", "join_type": "inner"}},
-    {{"model": "Product",   "from_field": "orderitem__product", "join_type": "inner"}}
+    {"model": "OrderItem", "from_field": "orderitem_set", "join_type": "inner"},
+    {"model": "Product",   "from_field": "orderitem__product", "join_type": "inner"}
   ],
   "filters": [],
   "aggregations": [
-    {{"field": "total_amount", "operation": "avg", "alias": "avg_order_value"}},
-    {{"field": "orderitem__id", "operation": "count", "alias": "item_count"}}
+    {"field": "total_amount", "operation": "avg", "alias": "avg_order_value"},
+    {"field": "orderitem__id", "operation": "count", "alias": "item_count"}
   ],
   "group_by": ["orderitem__product__category"],
   "select_fields": [],
-  "order_by": [{{"field": "avg_order_value", "direction": "desc"}}],
+  "order_by": [{"field": "avg_order_value", "direction": "desc"}],
   "limit": null,
   "chart_type": "bar"
-}}
+}
 """
 
 # Human mode: instruction + examples for aggregated single-row vs list
@@ -151,41 +151,55 @@ when the question explicitly asks for breakdown or top-N.
 
 HUMAN_EXAMPLES = """Q: "What is the total sale of user John?"
 A:
-{{
+{
   "model": "Sale",
-  "joins": [{{"model": "User", "from_field": "user", "join_type": "inner"}}],
-  "filters": [{{"field": "user__username", "operator": "exact", "value": "John"}}],
-  "aggregations": [{{"field": "amount", "operation": "sum", "alias": "total_sale"}}],
+  "joins": [{"model": "User", "from_field": "user", "join_type": "inner"}],
+  "filters": [{"field": "user__username", "operator": "exact", "value": "John"}],
+  "aggregations": [{"field": "amount", "operation": "sum", "alias": "total_sale"}],
   "group_by": [],
   "select_fields": [],
   "order_by": [],
   "limit": null,
   "chart_type": "none"
-}}
+}
 
 Q: "Top 10 best-selling items"
 A:
-{{
+{
   "model": "OrderItem",
-  "joins": [{{"model": "Product", "from_field": "product", "join_type": "inner"}}],
+  "joins": [{"model": "Product", "from_field": "product", "join_type": "inner"}],
   "filters": [],
-  "aggregations": [{{"field": "quantity", "operation": "sum", "alias": "total_sold"}}],
+  "aggregations": [{"field": "quantity", "operation": "sum", "alias": "total_sold"}],
   "group_by": ["product__name"],
   "select_fields": [],
-  "order_by": [{{"field": "total_sold", "direction": "desc"}}],
+  "order_by": [{"field": "total_sold", "direction": "desc"}],
   "limit": 10,
   "chart_type": "none"
-}}
+}
 """
 
-# LangChain ChatPromptTemplate for structured prompt handling:
-# - Validates template variables (schema, question)
-# - Handles escaping of literal braces in examples
-# - Reusable across different LLM backends
-CHAT_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", SYSTEM_TEMPLATE),
-    ("human", "{question}"),
-])
+@lru_cache(maxsize=32)
+def _render_system_prompt(schema: str, human_friendly_result: bool) -> str:
+    """
+    Render SYSTEM_TEMPLATE for a given schema and output mode.
+
+    Only the question varies between calls, so the multi-KB system prompt is
+    rendered once per (schema, human_friendly_result) pair and reused.
+    """
+    if human_friendly_result:
+        output_mode_section = HUMAN_OUTPUT_MODE_SECTION
+        examples = HUMAN_EXAMPLES
+    else:
+        output_mode_section = ""
+        examples = MACHINE_EXAMPLES
+    # Plain sentinel replacement: no brace escaping in the template, and the
+    # schema goes in last so its text is never scanned for placeholders
+    return (
+        SYSTEM_TEMPLATE
+        .replace("__OUTPUT_MODE_SECTION__", output_mode_section)
+        .replace("__EXAMPLES__", examples)
+        .replace("__SCHEMA__", schema)
+    )
 
 
 def build_messages(
@@ -195,28 +209,16 @@ def build_messages(
 ) -> dict:
     """
     Build system + user messages for the AI query pipeline.
-    Uses LangChain's ChatPromptTemplate for robust variable substitution
-    and consistent prompt structure.
+    The rendered system prompt is cached per (schema, human_friendly_result),
+    so repeated queries against the same schema only build the user message.
 
     When human_friendly_result=True, adds instructions so the LLM prefers
     aggregated single-row results for totals/summaries, and list results only
     when the question explicitly asks for breakdown or top-N.
     """
-    if human_friendly_result:
-        output_mode_section = HUMAN_OUTPUT_MODE_SECTION
-        examples = HUMAN_EXAMPLES
-    else:
-        output_mode_section = ""
-        examples = MACHINE_EXAMPLES
-    messages = CHAT_PROMPT.format_messages(
-        schema=schema,
-        question=question,
-        output_mode_section=output_mode_section,
-        examples=examples,
-    )
     return {
-        "system": messages[0].content,
-        "messages": [{"role": "user", "content": messages[1].content}],
+        "system": _render_system_prompt(schema, human_friendly_result),
+        "messages": [{"role": "user", "content": question}],
     }
 
 
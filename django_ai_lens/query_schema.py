@@ -1,5 +1,7 @@
 from __future__ import annotations
-from pydantic import BaseModel, field_validator, model_validator
+import re
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict, field_validator, model_validator
 from typing import Optional, Literal
 from enum import Enum
 
@@ -56,14 +58,38 @@ class ChartType(str, Enum):
 
 # ── Field name safety ──────────────────────────────────────────────────────
 
-BLOCKED_FIELD_SEGMENTS = {"delete", "update", "create", "raw", "execute", "bulk", "truncate"}
+BLOCKED_FIELD_SEGMENTS = frozenset({"delete", "update", "create", "raw", "execute", "bulk", "truncate"})
 
 
+# A path of segments separated by "__", where (as after v.split("__")) every
+# segment is letters/digits/underscores with at least one letter or digit
+_FIELD_PATH_RE = re.compile(r"_?[^\W_]+(?:_{1,3}[^\W_]+)*_?")
+
+# A whole segment equal to a blocked word, in any case
+_BLOCKED_SEGMENT_RE = re.compile(
+    r"(?:\A|(?<!_)__)(?:"
+    + "|".join(map(re.escape, sorted(BLOCKED_FIELD_SEGMENTS)))
+    + r")(?:__|\Z)",
+    re.IGNORECASE,
+)
+
+
+# Aggregation alias: letters/digits/underscores, at least one letter or digit
+_ALIAS_RE = re.compile(r"_*[^\W_]\w*")
+
+
+@lru_cache(maxsize=2048)
 def validate_field_name(v: str) -> str:
     """
     Allow Django ORM double-underscore traversal (order__customer__name)
     but block any segment that maps to a mutating operation.
+
+    Valid paths are accepted with two compiled regexes, and results are
+    memoized since the LLM reuses the same paths across queries. The
+    per-segment loop only runs to report which segment was rejected.
     """
+    if _FIELD_PATH_RE.fullmatch(v) and not _BLOCKED_SEGMENT_RE.search(v):
+        return v
     segments = v.split("__")
     for seg in segments:
         if seg.lower() in BLOCKED_FIELD_SEGMENTS:
@@ -73,6 +99,11 @@ def validate_field_name(v: str) -> str:
     return v
 
 
+# Shared by every schema model: instances are immutable once validated, and
+# keys the LLM invents (e.g. "having") fail validation instead of being dropped
+_MODEL_CONFIG = ConfigDict(frozen=True, extra="forbid")
+
+
 # ── Join schema ────────────────────────────────────────────────────────────
 
 class JoinSchema(BaseModel):
@@ -90,6 +121,8 @@ class JoinSchema(BaseModel):
     - Order → Product (M2M through OrderItem):
         { "model": "Product", "from_field": "orderitem__product", "join_type": "inner" }
     """
+    model_config = _MODEL_CONFIG
+
     model: str
     from_field: str          # The ORM path from the root model to this relation
     join_type: JoinType = JoinType.INNER
@@ -116,9 +149,11 @@ class FilterSchema(BaseModel):
     The `field` may traverse relations using __ notation, e.g.
     "customer__country" or "orderitem__product__category".
     """
+    model_config = _MODEL_CONFIG
+
     field: str
     operator: FilterOperator
-    value: str | int | float | bool | list | None
+    value: str | int | float | bool | list[str | int | float | bool] | None
 
     @field_validator("field")
     @classmethod
@@ -133,13 +168,15 @@ class AggregationSchema(BaseModel):
     A single annotated aggregation column, e.g. SUM(orderitem__price).
     The field may span relations.
     """
+    model_config = _MODEL_CONFIG
+
     field: str
     operation: AggregationOperation
     alias: str
     # Optional: only aggregate rows where a condition holds (filtered annotate)
     filter_field: Optional[str] = None
     filter_operator: Optional[FilterOperator] = None
-    filter_value: Optional[str | int | float | bool | list | None] = None
+    filter_value: Optional[str | int | float | bool | list[str | int | float | bool] | None] = None
 
     @field_validator("field")
     @classmethod
@@ -149,7 +186,7 @@ class AggregationSchema(BaseModel):
     @field_validator("alias")
     @classmethod
     def safe_alias(cls, v: str) -> str:
-        if not v.replace("_", "").isalnum():
+        if not _ALIAS_RE.fullmatch(v):
             raise ValueError("Alias must be alphanumeric with underscores only.")
         return v
 
@@ -164,6 +201,8 @@ class AggregationSchema(BaseModel):
 # ── Order-by schema ────────────────────────────────────────────────────────
 
 class OrderBySchema(BaseModel):
+    model_config = _MODEL_CONFIG
+
     field: str
     direction: Literal["asc", "desc"] = "asc"
 
@@ -180,6 +219,8 @@ class AIQuerySchema(BaseModel):
     Complete structured query description produced by the LLM.
     No executable code — only declarative intent.
     """
+    model_config = _MODEL_CONFIG
+
     model: str
     joins: list[JoinSchema]               = []
     filters: list[FilterSchema]           = []
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+from itertools import chain
+from typing import Callable, Iterator
+
+import django
+from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.db.models import (
     Count, Sum, Avg, Max, Min,
     QuerySet, Q,
     Prefetch,
 )
-from django.db.models.fields.related import ManyToManyField
-from django.db.models.fields.reverse_related import ManyToOneRel, ManyToManyRel, OneToOneRel
 
 from django_ai_lens.query_schema import (
     AIQuerySchema,
@@ -33,67 +39,63 @@ AGG_MAP = {
 
 def resolve_model(model_name: str, app_labels: list[str]):
     """Find a model class by name within the allowed apps only."""
+    model = _build_model_index(tuple(app_labels)).get(model_name.lower())
+    if model is None:
+        raise ValueError(
+            f"Model '{model_name}' not found in apps: {list(app_labels)}. "
+            "The AI may have hallucinated a model name."
+        )
+    return model
+
+
+@lru_cache(maxsize=32)
+def _build_model_index(app_labels: tuple[str, ...]) -> dict[str, type]:
+    """
+    Map lowercased model name → model class for the given apps, so resolving
+    a model is one dict lookup. Keys are lowercased and auto-created M2M
+    through models are included, to match apps.get_model(); when two apps define the same name, the first app label wins. The app
+    registry doesn't change once Django is set up, so this is built once.
+    """
+    index: dict[str, type] = {}
     for app_label in app_labels:
         try:
-            return apps.get_model(app_label, model_name)
+            app_config = apps.get_app_config(app_label)
         except LookupError:
             continue
-    raise ValueError(
-        f"Model '{model_name}' not found in apps: {app_labels}. "
-        "The AI may have hallucinated a model name."
-    )
-
+        for model in app_config.get_models(include_auto_created=True):
+            index.setdefault(model._meta.model_name, model)
+    return index
 
-# ── Select-related vs prefetch-related (relation type detection) ──────────────
 
-# Forward FK / OneToOne → select_related (single SQL JOIN)
-# Reverse FK, reverse M2M, forward M2M → prefetch_related (separate query)
-PREFETCH_FIELD_TYPES = (ManyToOneRel, OneToOneRel, ManyToManyRel, ManyToManyField)
+# ── Annotated aggregation builder ─────────────────────────────────────────
 
+def _plain_factory(agg_class):
+    return lambda agg: agg_class(agg.field)
 
-def _is_prefetch_relation(model, path: str) -> bool:
-    """
-    Determine if a relation path requires prefetch_related (True) or
-    select_related (False).
 
-    - Forward ForeignKey / OneToOne (all segments) → select_related
-    - Any segment is reverse FK, M2M, or reverse M2M → prefetch_related
+def _filtered_factory(agg_class):
+    return lambda agg: agg_class(
+        agg.field,
+        filter=Q(**{f"{agg.filter_field}__{agg.filter_operator.value}": agg.filter_value}),
+    )
 
-    Example: ticket__plantation_sources__plantation — plantation_sources is
-    reverse (related_name), so the whole path must use prefetch_related.
-    """
-    segments = path.split("__")
-    current_model = model
-    for segment in segments:
-        try:
-            field = current_model._meta.get_field(segment)
-        except Exception:
-            return True  # Can't resolve → prefetch to be safe
-        if isinstance(field, PREFETCH_FIELD_TYPES) or not field.concrete:
-            return True  # Reverse or M2M anywhere in path → prefetch
-        # Move to related model for next segment
-        if hasattr(field, "related_model") and field.related_model:
-            current_model = field.related_model
-        else:
-            break
-    return False
 
+# (operation, has_filter) → factory building the aggregation expression
+_AGG_FACTORIES = {
+    **{(op, False): _plain_factory(cls) for op, cls in AGG_MAP.items()},
+    **{(op, True): _filtered_factory(cls) for op, cls in AGG_MAP.items()},
+}
 
-# ── Annotated aggregation builder ─────────────────────────────────────────
 
 def _build_annotation(agg: AggregationSchema):
     """
     Build a single Django aggregation expression, optionally with a
     conditional filter (filtered annotate).
     """
-    agg_class = AGG_MAP[agg.operation]
-
-    if agg.filter_field and agg.filter_operator and agg.filter_value is not None:
-        lookup = f"{agg.filter_field}__{agg.filter_operator.value}"
-        condition = Q(**{lookup: agg.filter_value})
-        return agg_class(agg.field, filter=condition)
-
-    return agg_class(agg.field)
+    has_filter = bool(
+        agg.filter_field and agg.filter_operator and agg.filter_value is not None
+    )
+    return _AGG_FACTORIES[(agg.operation, has_filter)](agg)
 
 
 # ── Main queryset builder ──────────────────────────────────────────────────
@@ -104,123 +106,213 @@ def build_queryset(schema: AIQuerySchema, app_labels: list[str]) -> QuerySet:
 
     Pipeline:
       1. Resolve root model
-      2. Apply select_related / prefetch_related for joins
-      3. Apply filters  (WHERE)
-      4. Apply group_by (.values())
-      5. Apply aggregations (.annotate())
-      6. Apply select_fields if no group_by and no aggregations
-      7. Apply order_by
-      8. Apply limit
+      2. Apply filters  (WHERE)
+      3. Apply group_by or select_fields (.values())
+      4. Apply aggregations (.annotate())
+      5. Return full rows as dicts (.values()) if no columns were chosen
+      6. Apply order_by
+      7. Apply limit
+
+    The result always yields dicts, never model instances. Joins in the schema
+    need no explicit step: related fields are reached through __ lookups and
+    Django adds the JOINs they need (select_related / prefetch_related have
+    no effect on .values() querysets).
+
+    The pipeline is compiled once per query shape (everything except filter
+    values) and cached, so a recurring query only re-applies its values.
+    """
+    build = _compile_builder(
+        schema.model,
+        tuple(app_labels),
+        tuple(f"{f.field}__{f.operator.value}" for f in schema.filters),
+        tuple(schema.group_by),
+        tuple(schema.select_fields),
+        tuple(agg.model_dump_json() for agg in schema.aggregations),
+        tuple(
+            "-" + o.field if o.direction == "desc" else o.field
+            for o in schema.order_by
+        ),
+        schema.limit,
+    )
+    return build([f.value for f in schema.filters])
+
+
+@lru_cache(maxsize=128)
+def _compile_builder(
+    model_name: str,
+    app_labels: tuple[str, ...],
+    filter_lookups: tuple[str, ...],
+    group_by: tuple[str, ...],
+    select_fields: tuple[str, ...],
+    aggregations: tuple[str, ...],
+    order_fields: tuple[str, ...],
+    limit: int | None,
+) -> Callable[[list], QuerySet]:
     """
+    Specialize the build_queryset pipeline for one query shape.
 
+    Returns a function of the filter values that applies only the steps this
+    shape needs, with lookups, annotations and ordering prepared up front.
+    Aggregations arrive as AggregationSchema JSON to keep the cache key hashable.
+    """
     # 1. Root model
-    model = resolve_model(schema.model, app_labels)
-    qs: QuerySet = model.objects.all()
-
-    # 2. Joins
-    #    Forward FK / O2O  → select_related  (single SQL JOIN, efficient)
-    #    Reverse FK / M2M  → prefetch_related (separate query, avoids row multiplication)
-    #
-    #    When aggregations are present we MUST use select_related for forward joins
-    #    to avoid the cartesian product issue that prefetch_related would cause.
-    #    For reverse relations WITH aggregations, Django handles it correctly via
-    #    the __ traversal in annotate() — no explicit prefetch needed.
-
-    if schema.joins:
-        has_aggregations = bool(schema.aggregations)
-
-        forward_paths: list[str] = []
-        prefetch_paths: list[str] = []
-
-        for join in schema.joins:
-            path = join.from_field
-            needs_prefetch = _is_prefetch_relation(model, path)
-
-            if needs_prefetch:
-                if not has_aggregations:
-                    # Only prefetch when we actually need to iterate the reverse set
-                    prefetch_paths.append(path)
-                # If aggregations exist, Django resolves the reverse via __ in annotate()
-            else:
-                forward_paths.append(path)
-
-        if forward_paths:
-            qs = qs.select_related(*forward_paths)
-        if prefetch_paths:
-            qs = qs.prefetch_related(*prefetch_paths)
-
-    # 3. Filters
-    for f in schema.filters:
-        lookup = f"{f.field}__{f.operator.value}"
-        qs = qs.filter(**{lookup: f.value})
-
-    # 4. Group by  (.values() before .annotate() tells Django to GROUP BY)
-    if schema.group_by:
-        qs = qs.values(*schema.group_by)
-    elif schema.select_fields:
-        # Explicit column selection without grouping
-        qs = qs.values(*schema.select_fields)
-
-    # 5. Aggregations
-    if schema.aggregations:
+    model = resolve_model(model_name, app_labels)
+    steps: list[Callable[[QuerySet, list], QuerySet]] = []
+
+    # 2. Filters
+    #    One .filter() call per condition, not one combined call: on
+    #    multi-valued relations (reverse FK, M2M) each chained filter may match
+    #    a different related row, while conditions in a single call must all
+    #    match the same row.
+    for i, lookup in enumerate(filter_lookups):
+        steps.append(
+            lambda qs, values, i=i, lookup=lookup: qs.filter(**{lookup: values[i]})
+        )
+
+    # 3. Group by  (.values() before .annotate() tells Django to GROUP BY),
+    #    or explicit column selection without grouping
+    columns = group_by or select_fields
+    if columns:
+        steps.append(lambda qs, _: qs.values(*columns))
+
+    # 4. Aggregations (expressions are copied when resolved, so reusable)
+    if aggregations:
         annotations = {
             agg.alias: _build_annotation(agg)
-            for agg in schema.aggregations
+            for agg in map(AggregationSchema.model_validate_json, aggregations)
         }
-        qs = qs.annotate(**annotations)
+        steps.append(lambda qs, _: qs.annotate(**annotations))
+
+    # 5. Full rows: .values() with no fields returns every concrete column
+    #    (by attname, e.g. customer_id) plus annotations, without building
+    #    a model instance per row.
+    if not columns:
+        steps.append(lambda qs, _: qs.values())
 
     # 6. Order by
-    if schema.order_by:
-        order_fields = [
-            f"-{o.field}" if o.direction == "desc" else o.field
-            for o in schema.order_by
-        ]
-        qs = qs.order_by(*order_fields)
+    if order_fields:
+        steps.append(lambda qs, _: qs.order_by(*order_fields))
 
     # 7. Limit
-    if schema.limit:
-        qs = qs[: schema.limit]
+    if limit:
+        steps.append(lambda qs, _: qs[:limit])
 
-    return qs
+    def build(filter_values: list) -> QuerySet:
+        qs: QuerySet = model.objects.all()
+        for step in steps:
+            qs = step(qs, filter_values)
+        return qs
+
+    return build
 
 
 # ── Result serialization ───────────────────────────────────────────────────
 
+# Rows fetched per database round-trip when streaming results
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def queryset_to_iter(
+    qs: QuerySet,
+    chunk_size: int = ITERATOR_CHUNK_SIZE,
+) -> Iterator[dict]:
+    """
+    Stream a .values() queryset as JSON-serializable dicts.
+
+    Large querysets use qs.iterator(chunk_size=...) so memory stays
+    O(chunk) instead of O(rows); on PostgreSQL this is a server-side cursor.
+    Slices of at most chunk_size rows (e.g. a schema limit) are fetched in one
+    go, which skips the extra cursor round-trips.
+    """
+    query = qs.query
+    small = (
+        query.is_sliced
+        and query.high_mark is not None
+        and query.high_mark - query.low_mark <= chunk_size
+    )
+    rows = iter(qs) if small else qs.iterator(chunk_size=chunk_size)
+    first = next(rows, None)
+    if first is None:
+        return
+    yield from map(_row_serializer(first), chain([first], rows))
+
+
 def queryset_to_list(qs: QuerySet) -> list[dict]:
+    """Materialize the queryset into a JSON-serializable list of dicts."""
+    return list(queryset_to_iter(qs))
+
+
+async def aqueryset_to_list(qs: QuerySet) -> list[dict]:
     """
-    Materialize the queryset into a JSON-serializable list of dicts.
+    Async version of queryset_to_list using QuerySet.aiterator(), so rows are
+    fetched without tying up a sync_to_async worker thread for the whole read.
 
-    - If .values() / .annotate() was used → already dicts, just serialize.
-    - If full model instances → convert via __dict__, stripping private keys.
+    Falls back to queryset_to_list in a thread where aiterator() can't be used
+    (Django < 4.1, or prefetch_related on Django < 5.0).
     """
-    results = list(qs)
+    if not hasattr(qs, "aiterator") or (
+        qs._prefetch_related_lookups and django.VERSION < (5, 0)
+    ):
+        return await sync_to_async(queryset_to_list)(qs)
 
-    if not results:
-        return []
+    data: list[dict] = []
+    serialize = None
+    async for row in qs.aiterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        if serialize is None:
+            serialize = _row_serializer(row)
+        data.append(serialize(row))
+    return data
 
-    if isinstance(results[0], dict):
-        return [_serialize_dict(row) for row in results]
 
-    # Model instances
-    return [
-        _serialize_dict(
-            {k: v for k, v in obj.__dict__.items() if not k.startswith("_")}
-        )
-        for obj in results
+def _row_serializer(first: dict) -> Callable[[dict], dict]:
+    """
+    Build a function that makes result rows shaped like `first` (dicts from a
+    .values() queryset, as build_queryset produces) JSON-serializable.
+
+    Columns have one type across rows, so the converter for each column is
+    picked once from the first row and only columns that need it are touched.
+    """
+    converters = [
+        (key, converter)
+        for key, value in first.items()
+        if (converter := _pick_converter(value)) is not None
     ]
 
+    def serialize(row: dict) -> dict:
+        for key, converter in converters:
+            row[key] = converter(row[key])
+        return row
+
+    return serialize
+
+
+def _pick_converter(sample):
+    """
+    Return the converter for a column given its first-row value, or None if
+    values can be passed through unchanged.
+    """
+    if isinstance(sample, Decimal):
+        return _decimal_to_float
+    if isinstance(sample, date):  # datetime is a date subclass
+        return _to_isoformat
+    if sample is None:
+        # Type unknown from a NULL sample — fall back to per-value dispatch
+        return _serialize_value
+    return None
+
+
+def _decimal_to_float(v):
+    return None if v is None else float(v)
+
+
+def _to_isoformat(v):
+    return None if v is None else v.isoformat()
+
 
-def _serialize_dict(row: dict) -> dict:
-    """Convert non-JSON-safe types (Decimal, datetime, etc.) to primitives."""
-    from decimal import Decimal
-    from datetime import datetime, date
-
-    out = {}
-    for k, v in row.items():
-        if isinstance(v, Decimal):
-            out[k] = float(v)
-        elif isinstance(v, (datetime, date)):
-            out[k] = v.isoformat()
-        else:
-            out[k] = v
-    return out
+def _serialize_value(v):
+    """Convert a non-JSON-safe value (Decimal, datetime, etc.) to a primitive."""
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, date):
+        return v.isoformat()
+    return v
@@ -9,8 +9,16 @@ from __future__ import annotations
 
 import json
 import os
+from functools import lru_cache
 from pathlib import Path
 
+from django.core.signals import setting_changed
+
+try:
+    import orjson
+except ImportError:  # Optional speedup: pip install django-ai-lens[orjson]
+    orjson = None
+
 
 # Default schema cache file (relative to cwd)
 DEFAULT_SCHEMA_FILE = ".django_ai_lens_schema.json"
@@ -40,7 +48,16 @@ def _get_installed_app_labels_from_settings() -> list[str]:
     Returns actual app labels (e.g. 'common', 'bplus') excluding Django built-ins
     and apps in EXCLUDE_APPS (default: ["auth"] to protect User model).
     Uses apps.get_app_configs() so 'apps.common' → 'common', not 'apps'.
+
+    The result is cached (the app registry doesn't change once Django is set
+    up) and reset when INSTALLED_APPS or EXCLUDE_APPS change.
     """
+    return list(_installed_app_labels())
+
+
+@lru_cache(maxsize=1)
+def _installed_app_labels() -> tuple[str, ...]:
+    """Cached body of _get_installed_app_labels_from_settings."""
     from django.apps import apps
     from django.conf import settings
 
@@ -62,7 +79,16 @@ def _get_installed_app_labels_from_settings() -> list[str]:
                 seen.add(app.label)
                 app_labels.append(app.label)
 
-    return _filter_excluded_apps(app_labels)
+    return tuple(_filter_excluded_apps(app_labels))
+
+
+def _reset_installed_app_labels(*, setting, **kwargs):
+    """Drop the cached app labels when app settings change (override_settings)."""
+    if setting in ("INSTALLED_APPS", "EXCLUDE_APPS"):
+        _installed_app_labels.cache_clear()
+
+
+setting_changed.connect(_reset_installed_app_labels)
 
 
 def get_models_schema(app_labels: list[str], include_help_text: bool = False) -> str:
@@ -80,7 +106,8 @@ def get_models_schema(app_labels: list[str], include_help_text: bool = False) ->
     """
     from django.apps import apps
 
-    schema_parts = []
+    # All output lines, models separated by a blank line; joined once at the end
+    out_lines: list[str] = []
     all_models: dict[str, type] = {}
 
     for app_label in app_labels:
@@ -92,42 +119,30 @@ def get_models_schema(app_labels: list[str], include_help_text: bool = False) ->
             all_models[model.__name__] = model
 
     for model_name, model in all_models.items():
-        lines = [f"Model: {model_name} (app: {model._meta.app_label})"]
+        meta = model._meta
+        if out_lines:
+            out_lines.append("")
+        out_lines.append(f"Model: {model_name} (app: {meta.app_label})")
 
         # Model description from Meta.verbose_name / verbose_name_plural
-        verbose_name = getattr(model._meta, "verbose_name", None)
-        verbose_name_plural = getattr(model._meta, "verbose_name_plural", None)
+        verbose_name = getattr(meta, "verbose_name", None)
+        verbose_name_plural = getattr(meta, "verbose_name_plural", None)
         if verbose_name:
             desc = str(verbose_name)
             if verbose_name_plural and str(verbose_name_plural) != str(verbose_name):
                 desc = f"{desc} (plural: {verbose_name_plural})"
-            lines.append(f"  Description: {desc}")
-
-        # ── Direct fields ──────────────────────────────────────────────────
-        lines.append("  Fields:")
-        for field in model._meta.get_fields():
-            if field.is_relation and not field.concrete:
-                continue
-
-            field_type = type(field).__name__
-            help_text = getattr(field, "help_text", None) or ""
-            help_suffix = f" — {help_text}" if (include_help_text and help_text) else ""
+            out_lines.append(f"  Description: {desc}")
 
-            if field.is_relation and field.concrete:
-                related_model = field.related_model
-                related_name = related_model.__name__ if related_model else "Unknown"
-                lines.append(
-                    f"    - {field.name}: {field_type} → {related_name}"
-                    f"{help_suffix}"
-                    f"  [ORM path: {field.name}__<{related_name.lower()}_field>]"
-                )
-            else:
-                lines.append(f"    - {field.name}: {field_type}{help_suffix}")
-
-        # ── Reverse relations ──────────────────────────────────────────────
+        # One pass over get_fields(), partitioned into direct fields, reverse
+        # relations and M2M (M2M fields are listed under Fields as well)
+        field_lines = []
         reverse_lines = []
-        for field in model._meta.get_fields():
-            if field.is_relation and not field.concrete:
+        m2m_lines = []
+        for field in meta.get_fields():
+            is_relation = field.is_relation
+
+            # ── Reverse relations ──────────────────────────────────────────
+            if is_relation and not field.concrete:
                 rel_type = type(field).__name__
                 related_model = field.related_model
                 related_name = related_model.__name__ if related_model else "Unknown"
@@ -140,38 +155,50 @@ def get_models_schema(app_labels: list[str], include_help_text: bool = False) ->
                     f"    - {accessor}: {rel_type} ← {related_name}"
                     f"  [ORM path: {accessor}__<{related_name.lower()}_field>]"
                 )
+                continue
 
-        if reverse_lines:
-            lines.append("  Reverse relations (can be used in filters / group_by):")
-            lines.extend(reverse_lines)
+            # ── Direct fields ──────────────────────────────────────────────
+            name = field.name
+            field_type = type(field).__name__
+            help_text = getattr(field, "help_text", None) or ""
+            help_suffix = f" — {help_text}" if (include_help_text and help_text) else ""
+
+            if not is_relation:
+                field_lines.append(f"    - {name}: {field_type}{help_suffix}")
+                continue
 
-        # ── M2M ───────────────────────────────────────────────────────────
-        m2m_lines = []
-        for field in model._meta.many_to_many:
             related_model = field.related_model
             related_name = related_model.__name__ if related_model else "Unknown"
-            through = field.remote_field.through
-            through_name = (
-                through.__name__
-                if through and not through._meta.auto_created
-                else "auto"
-            )
-            help_text = getattr(field, "help_text", None) or ""
-            help_suffix = f" — {help_text}" if (include_help_text and help_text) else ""
-            m2m_lines.append(
-                f"    - {field.name}: ManyToManyField → {related_name}"
-                f"{help_suffix}"
-                f"  [through: {through_name}]"
-                f"  [ORM path: {field.name}__<{related_name.lower()}_field>]"
+            orm_path = f"  [ORM path: {name}__<{related_name.lower()}_field>]"
+            field_lines.append(
+                f"    - {name}: {field_type} → {related_name}{help_suffix}{orm_path}"
             )
 
-        if m2m_lines:
-            lines.append("  ManyToMany:")
-            lines.extend(m2m_lines)
+            # ── M2M ────────────────────────────────────────────────────────
+            if field.many_to_many:
+                through = field.remote_field.through
+                through_name = (
+                    through.__name__
+                    if through and not through._meta.auto_created
+                    else "auto"
+                )
+                m2m_lines.append(
+                    f"    - {name}: ManyToManyField → {related_name}{help_suffix}"
+                    f"  [through: {through_name}]{orm_path}"
+                )
 
-        schema_parts.append("\n".join(lines))
+        out_lines.append("  Fields:")
+        out_lines.extend(field_lines)
 
-    return "\n\n".join(schema_parts)
+        if reverse_lines:
+            out_lines.append("  Reverse relations (can be used in filters / group_by):")
+            out_lines.extend(reverse_lines)
+
+        if m2m_lines:
+            out_lines.append("  ManyToMany:")
+            out_lines.extend(m2m_lines)
+
+    return "\n".join(out_lines)
 
 
 def extract_from_loaded_django(
@@ -201,7 +228,10 @@ def extract_from_loaded_django(
         "settings_module": settings_module,
         "project_path": "",
     }
-    out_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    if orjson is not None:
+        out_path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+    else:
+        out_path.write_bytes(json.dumps(payload, indent=2).encode("utf-8"))
 
     return {
         "schema": schema,
@@ -252,5 +282,6 @@ def load_schema(
             f"Schema file not found: {path}. Run extract_and_save() first from Django shell."
         )
 
-    data = json.loads(path.read_text(encoding="utf-8"))
+    raw = path.read_bytes()  # both parsers take UTF-8 bytes directly
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
     return data["schema"], data.get("app_labels", [])